@@ -23,6 +23,9 @@ Usage:
 """
 
 import argparse
+import base64
+import collections
+import http.client
 import json
 import os
 import shutil
@@ -32,87 +35,214 @@ import sys
 import time
 import urllib.request
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote, urljoin, urlsplit
 
 # --- Shearwater decompression ------------------------------------------------
 
-def decompress_lre(block: bytes) -> bytes:
-    """Decode one 144-byte LRE-compressed block (9-bit packed values)."""
-    out = bytearray()
-    nbits = len(block) * 8
-    offset = 0
-    while offset + 9 <= nbits:
-        byte_idx = offset // 8
-        bit_idx = offset % 8
-        if byte_idx + 1 >= len(block):
-            break
-        raw = (block[byte_idx] << 8) | block[byte_idx + 1]
-        value = (raw >> (16 - bit_idx - 9)) & 0x1FF
+# Ceiling on one dive's decompressed stream. Real logs are far smaller (10 h
+# at 2 s samples is ~600 KB); anything past this is treated as corrupt.
+MAX_DECOMPRESSED = 4 * 1024 * 1024
+
+
+def _lre_bound(raw_len: int) -> int:
+    """Most bytes raw_len bytes of LRE data can decode to (255 per 9-bit code)."""
+    return raw_len * 8 // 9 * 255
+
+
+def _decompress_lre_into(block: bytes, out: bytearray, pos: int) -> int:
+    """
+    Decode one 144-byte LRE-compressed block (9-bit packed values) into out at
+    pos. out must be zero-filled from pos on, so zero runs only move the
+    cursor. Returns the number of bytes written; raises ValueError if the
+    block decodes past the end of out.
+    """
+    start = pos
+    size = len(out)
+    # Read the block as one big-endian int: each 9-bit code is then a
+    # single shift + mask instead of a two-byte gather per code.
+    bits = int.from_bytes(block, 'big')
+    for shift in range(len(block) * 8 - 9, -1, -9):
+        value = (bits >> shift) & 0x1FF
         if value & 0x100:
-            out.append(value & 0xFF)
+            if pos >= size:
+                raise ValueError(f"LRE data decodes past {size} bytes")
+            out[pos] = value & 0xFF
+            pos += 1
         elif value == 0:
             break
         else:
-            out.extend(b'\x00' * value)
-        offset += 9
+            pos += value
+    if pos > size:
+        raise ValueError(f"LRE data decodes past {size} bytes")
+    return pos - start
+
+
+def decompress_lre(block: bytes) -> bytes:
+    """
+    Decode one 144-byte LRE-compressed block (9-bit packed values).
+    Standalone bytes-in/bytes-out helper; decompress_shearwater decodes all
+    blocks into one buffer with _decompress_lre_into instead.
+    """
+    out = bytearray(_lre_bound(len(block)))
+    del out[_decompress_lre_into(block, out, 0):]
     return bytes(out)
 
 
+def _xor_stripes_into(buf: bytearray, start: int, stop: int, prev: int):
+    """
+    XOR-decode the whole 32-byte stripes of buf[start:stop] in place; start is
+    a stripe boundary. Each stripe is handled as a 256-bit int, so it is XORed
+    with the previous decoded stripe (prev) in a single operation.
+    Returns (end, prev) so decoding can resume once more data is written.
+    """
+    end = stop - (stop - start) % 32
+    for i in range(start, end, 32):
+        prev ^= int.from_bytes(buf[i:i + 32], 'big')
+        buf[i:i + 32] = prev.to_bytes(32, 'big')
+    return end, prev
+
+
+def _xor_tail_into(buf: bytearray, start: int, stop: int, prev: int):
+    """XOR-decode a trailing partial stripe against the head of prev."""
+    tail = stop - start
+    if tail:
+        prev = (prev >> (8 * (32 - tail))) ^ int.from_bytes(buf[start:stop], 'big')
+        buf[start:stop] = prev.to_bytes(tail, 'big')
+
+
 def decompress_xor(data: bytes) -> bytes:
-    """Apply XOR decompression across full result."""
+    """
+    Apply XOR decompression across full result.
+    Standalone bytes-in/bytes-out helper; decompress_shearwater applies the
+    same stripe steps in place as each block is decoded.
+    """
     result = bytearray(data)
-    for i in range(32, len(result)):
-        result[i] ^= result[i - 32]
+    end, prev = _xor_stripes_into(result, 0, len(result), 0)
+    _xor_tail_into(result, end, len(result), prev)
     return bytes(result)
 
 
-def decompress_shearwater(raw: bytes) -> bytes:
-    """Full decompression: LRE per 144-byte block, then XOR."""
-    blocks = bytearray()
+def decompress_shearwater(raw: bytes, limit: Optional[int] = None) -> bytearray:
+    """
+    Full decompression: LRE per 144-byte block, then XOR.
+    The XOR stage runs on each block's output right after it is decoded, so
+    the buffer is walked once rather than once per stage. With limit, stops
+    after the block that brings the output to at least limit bytes.
+    Raises ValueError if the output would exceed MAX_DECOMPRESSED.
+    """
+    cap = min(_lre_bound(len(raw)), MAX_DECOMPRESSED)
+    if limit is not None:
+        cap = min(cap, limit + _lre_bound(144))
+    # Zero-filled up front, sized for a typical ratio, so zero runs cost
+    # nothing and the buffer rarely grows. Zero-filling the worst-case bound
+    # (~227x the input) would cost more than the growth it saves.
+    blocks = bytearray(min(cap, 8 * len(raw)))
+    pos = end = prev = 0
     for i in range(0, len(raw), 144):
-        blocks.extend(decompress_lre(raw[i:i + 144]))
-    return decompress_xor(bytes(blocks))
+        block = raw[i:i + 144]
+        need = pos + _lre_bound(len(block))
+        if need > len(blocks) and len(blocks) < cap:
+            blocks += bytes(min(max(need, 2 * len(blocks)), cap) - len(blocks))
+        pos += _decompress_lre_into(block, blocks, pos)
+        end, prev = _xor_stripes_into(blocks, end, pos, prev)
+        if limit is not None and pos >= limit:
+            break
+    _xor_tail_into(blocks, end, pos, prev)
+    del blocks[pos:]
+    return blocks  # handed over as-is; no bytes() copy of the whole stream
 
 
 # --- GPS extraction -----------------------------------------------------------
 
 AI_ON_GPS = 6
 
+# GPS lat/lon pair: two signed 32-bit big-endian ints at record offset +21
+_S_LATLON = struct.Struct('>ii')
+
+def _gps_fix(data, i, unpack_latlon=_S_LATLON.unpack_from):
+    """
+    Decode the GPS pair of the record at offset i as decimal degrees, or None
+    for no fix. Both byte-swaps happen in one C-level unpack.
+    """
+    lat, lon = unpack_latlon(data, i + 21)
+    # (0, 0) and (-1, -1) mean no fix; compared without building tuples
+    if (lat or lon) and (lat != -1 or lon != -1):
+        return lat / 100000.0, lon / 100000.0
+    return None
+
+
+def _record_offsets(rtypes, rtype):
+    """
+    Yield the byte offset of each record of the given type, in stream order.
+    rtypes is the column of record type bytes (byte 0 of every record), so
+    each lookup is a C-level bytes.find rather than a per-record Python loop.
+    """
+    rec = rtypes.find(rtype)
+    while rec >= 0:
+        yield rec * 32
+        rec = rtypes.find(rtype, rec + 1)
+
+
+def _first_fix(data, rtypes, rtype):
+    """First valid GPS fix among the records of the given type, or None."""
+    for i in _record_offsets(rtypes, rtype):
+        fix = _gps_fix(data, i)
+        if fix:
+            return fix
+    return None
+
+
+# Opening records 0-9 lead the stream, so this much output covers record 4
+_OPENING_LEN = 10 * 32
+
+def is_probably_ai_on_gps(raw_data: bytes) -> bool:
+    """
+    Cheap pre-check: decode only the opening records and reject dives whose
+    opening record 4 shows an AI mode other than AI_ON_GPS. Returns True
+    when the opening records don't settle it.
+    """
+    head = decompress_shearwater(raw_data, limit=_OPENING_LEN)
+    rec = head[:len(head) - len(head) % 32:32].find(0x14)
+    if rec < 0:
+        return True
+    i = rec * 32
+    return head[i + 16] < 7 or head[i + 28] == AI_ON_GPS
+
+
 def extract_gps(raw_data: bytes):
     """
     Extract GPS from decompressed Shearwater native format.
     Returns (entry_lat, entry_lon, exit_lat, exit_lon) or None.
     Coordinates are decimal degrees; None for missing exit.
+    Raises ValueError if the stream is corrupt or decodes past
+    MAX_DECOMPRESSED.
     """
+    if not is_probably_ai_on_gps(raw_data):
+        return None
     data = decompress_shearwater(raw_data)
     if len(data) < 64:
         return None
 
-    aimode = None
-    entry = None
-    exit_ = None
-
-    for i in range(0, len(data) - 31, 32):
-        rtype = data[i]
+    # Byte 0 of every 32-byte record, sliced out as one column. Each record
+    # type is then located directly, and appears once per dive.
+    len_data = len(data)
+    rtypes = data[:len_data - len_data % 32:32]
 
-        if rtype == 0x14:  # Opening Record 4 — AI mode
-            if data[i + 16] >= 7:  # logversion >= 7
-                aimode = data[i + 28]
-
-        elif rtype == 0x19:  # Opening Record 9 — entry GPS
-            lat = struct.unpack('>i', data[i + 21:i + 25])[0]
-            lon = struct.unpack('>i', data[i + 25:i + 29])[0]
-            if (lat, lon) not in ((0, 0), (-1, -1)):
-                entry = (lat / 100000.0, lon / 100000.0)
-
-        elif rtype == 0x29:  # Closing Record 9 — exit GPS
-            lat = struct.unpack('>i', data[i + 21:i + 25])[0]
-            lon = struct.unpack('>i', data[i + 25:i + 29])[0]
-            if (lat, lon) not in ((0, 0), (-1, -1)):
-                exit_ = (lat / 100000.0, lon / 100000.0)
+    aimode = None
+    for i in _record_offsets(rtypes, 0x14):  # Opening Record 4 — AI mode
+        if data[i + 16] >= 7:  # logversion >= 7
+            aimode = data[i + 28]
+            break
+    if aimode != AI_ON_GPS:
+        return None
 
-    if aimode != AI_ON_GPS or entry is None:
+    entry = _first_fix(data, rtypes, 0x19)  # Opening Record 9 — entry GPS
+    if entry is None:
         return None
+    exit_ = _first_fix(data, rtypes, 0x29)  # Closing Record 9 — exit GPS
 
     return entry, exit_
 
@@ -122,20 +252,80 @@ def extract_gps(raw_data: bytes):
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
 USER_AGENT = "macdive-gps-backfill/1.0 (dive log utility)"
 
+# One HTTPS connection kept alive across lookups (Nominatim supports it), so
+# each request skips the TCP + TLS handshake. Only the geocoding thread uses it.
+_nominatim_conn = None
+
+def _nominatim_connect():
+    """
+    Open an HTTPS connection to Nominatim, tunnelling through the proxy from
+    HTTPS_PROXY / https_proxy (honoring no_proxy) as urlopen would.
+    """
+    host = urlsplit(NOMINATIM_URL).hostname
+    proxy = urllib.request.getproxies().get("https")
+    if not proxy or urllib.request.proxy_bypass(host):
+        return http.client.HTTPSConnection(host, timeout=10)
+
+    if "://" not in proxy:
+        proxy = f"http://{proxy}"
+    parts = urlsplit(proxy)
+    headers = {}
+    if parts.username:
+        creds = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+        headers["Proxy-Authorization"] = (
+            "Basic " + base64.b64encode(creds.encode()).decode())
+    # No port in the proxy URL: urlopen hands the bare host to HTTPSConnection,
+    # which defaults to 443, so do the same.
+    conn = http.client.HTTPSConnection(parts.hostname, parts.port or 443,
+                                       timeout=10)
+    conn.set_tunnel(host, 443, headers=headers)
+    return conn
+
+
+def close_nominatim():
+    """Close the kept-alive Nominatim connection, if one is open."""
+    global _nominatim_conn
+    if _nominatim_conn is not None:
+        _nominatim_conn.close()
+        _nominatim_conn = None
+
+
+def _nominatim_get(path):
+    """GET path from Nominatim on the shared connection; returns the body."""
+    global _nominatim_conn
+    for retry in (True, False):
+        if _nominatim_conn is None:
+            _nominatim_conn = _nominatim_connect()
+        try:
+            _nominatim_conn.request("GET", path, headers={"User-Agent": USER_AGENT})
+            resp = _nominatim_conn.getresponse()
+            body = resp.read()
+        except Exception as e:
+            close_nominatim()
+            # The server may have dropped the idle connection; reconnect once.
+            if not (retry and isinstance(e, ConnectionError)):
+                raise
+        else:
+            break
+    if 300 <= resp.status < 400 and resp.getheader("Location"):
+        # Rare; let urlopen follow the redirect chain wherever it leads.
+        url = urljoin(NOMINATIM_URL, resp.getheader("Location"))
+        req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(req, timeout=10) as redirected:
+            return redirected.read()
+    if resp.status != 200:
+        raise OSError(f"HTTP Error {resp.status}: {resp.reason}")
+    return body
+
+
 def reverse_geocode(lat, lon):
     """
     Reverse-geocode coordinates via Nominatim (OpenStreetMap).
-    Returns (country, location, water_body) or None on failure.
+    Returns (country, location, water_body); raises on network/HTTP failure.
     """
-    url = (f"{NOMINATIM_URL}?lat={lat}&lon={lon}"
-           f"&format=json&zoom=10&addressdetails=1&accept-language=en")
-    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read())
-    except Exception as e:
-        print(f"    geocoding failed: {e}")
-        return None
+    path = (f"{urlsplit(NOMINATIM_URL).path}?lat={lat}&lon={lon}"
+            f"&format=json&zoom=10&addressdetails=1&accept-language=en")
+    data = json.loads(_nominatim_get(path))
 
     addr = data.get("address", {})
     country = addr.get("country", "")
@@ -147,6 +337,65 @@ def reverse_geocode(lat, lon):
     return country, location, water
 
 
+GEOCODE_CACHE = (Path.home() / "Library" / "Caches" / "macdive-gps-backfill"
+                 / "geocode.sqlite")
+
+def open_geocode_cache(path=GEOCODE_CACHE):
+    """
+    Open the on-disk reverse-geocode cache, creating it if needed.
+    Returns None if the cache can't be opened (geocoding still works).
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cache = sqlite3.connect(str(path))
+        cache.execute("""
+            CREATE TABLE IF NOT EXISTS geocache
+                (key TEXT PRIMARY KEY, country TEXT, location TEXT, water TEXT)
+        """)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Geocode cache unavailable ({e}); continuing without it.\n")
+        return None
+    return cache
+
+
+def geocode_key(lat, lon):
+    """Cache key: coordinates rounded to ~100 m, so dives at one site share it."""
+    return f"{round(lat, 3)}:{round(lon, 3)}"
+
+
+def cached_geocode(cache, key):
+    """Return the cached (country, location, water_body) for key, or None."""
+    row = cache.execute(
+        "SELECT country, location, water FROM geocache WHERE key = ?", (key,)
+    ).fetchone()
+    return tuple(row) if row else None
+
+
+def store_geocode(cache, key, geo):
+    """Save a successful reverse-geocode result."""
+    cache.execute("INSERT OR IGNORE INTO geocache VALUES (?, ?, ?, ?)",
+                  (key,) + tuple(geo))
+    cache.commit()
+
+
+def rate_limited(func, interval):
+    """Wrap func so each call starts at least interval seconds after the last ended."""
+    last = None
+
+    def wrapper(*args):
+        nonlocal last
+        if last is not None:
+            delay = last + interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            return func(*args)
+        finally:
+            last = time.monotonic()
+
+    return wrapper
+
+
 # --- MacDive database operations ----------------------------------------------
 
 DEFAULT_DB = os.path.expanduser(
@@ -154,9 +403,12 @@ DEFAULT_DB = os.path.expanduser(
 )
 
 def find_candidates(db):
-    """Find Shearwater dives with ZRAWDATA but no GPS on their dive site."""
+    """
+    Find Shearwater dives with ZRAWDATA but no GPS on their dive site.
+    The blob itself is left out; read it per dive with read_raw_data().
+    """
     return db.execute("""
-        SELECT d.Z_PK, d.ZDIVENUMBER, d.ZRAWDATA, d.ZNOTES,
+        SELECT d.Z_PK, d.ZDIVENUMBER, d.ZNOTES,
                d.ZRELATIONSHIPDIVESITE, d.Z_OPT
         FROM ZDIVE d
         LEFT JOIN ZDIVESITE s ON d.ZRELATIONSHIPDIVESITE = s.Z_PK
@@ -168,28 +420,77 @@ def find_candidates(db):
     """).fetchall()
 
 
-def get_divesite_ent(db):
-    """Get the Z_ENT value for the DiveSite entity."""
+def read_raw_data(db, dive_pk):
+    """Read one dive's ZRAWDATA, via incremental blob I/O where available."""
+    if hasattr(db, "blobopen"):  # Python 3.11+; Z_PK is the rowid
+        with db.blobopen("ZDIVE", "ZRAWDATA", dive_pk, readonly=True) as blob:
+            return blob.read()
+    return db.execute(
+        "SELECT ZRAWDATA FROM ZDIVE WHERE Z_PK = ?", (dive_pk,)
+    ).fetchone()[0]
+
+
+def _extract_gps_or_error(raw_data: bytes):
+    """extract_gps(), but a corrupt stream's ValueError is returned, not raised."""
+    try:
+        return extract_gps(raw_data)
+    except ValueError as e:
+        return e
+
+
+# Below this many candidates, starting worker processes (spawn on macOS)
+# costs more than decoding the dives in this process (~2 ms each).
+_POOL_MIN_CANDIDATES = 100
+
+def extract_gps_all(db, candidates):
+    """
+    Yield extract_gps() for each candidate's raw data, in candidate order;
+    corrupt streams yield their ValueError instead of stopping the run.
+    Large batches are spread over worker processes with a bounded window of
+    blobs in flight, so they are never all read into memory at once.
+    """
+    pks = iter([c[0] for c in candidates])
+    if len(candidates) < _POOL_MIN_CANDIDATES:
+        for dive_pk in pks:
+            yield _extract_gps_or_error(read_raw_data(db, dive_pk))
+        return
+
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as decoder:
+        window = collections.deque()
+        for dive_pk in pks:
+            window.append(decoder.submit(_extract_gps_or_error, read_raw_data(db, dive_pk)))
+            if len(window) >= 2 * workers:
+                break
+        while window:
+            result = window.popleft().result()
+            dive_pk = next(pks, None)
+            if dive_pk is not None:
+                window.append(decoder.submit(_extract_gps_or_error, read_raw_data(db, dive_pk)))
+            yield result
+
+
+def get_divesite_keys(db):
+    """
+    Get the DiveSite entity's Z_ENT and next Z_PK (current Z_MAX + 1) with a
+    single Z_PRIMARYKEY read; later PKs are assigned sequentially from it.
+    """
     row = db.execute(
-        "SELECT Z_ENT FROM Z_PRIMARYKEY WHERE Z_NAME = 'DiveSite'"
+        "SELECT Z_ENT, Z_MAX FROM Z_PRIMARYKEY WHERE Z_NAME = 'DiveSite'"
     ).fetchone()
     if not row:
         print("ERROR: Z_PRIMARYKEY has no DiveSite entity. Is this a MacDive database?")
         sys.exit(1)
-    return row[0]
-
-
-def next_site_pk(db):
-    """Get the next Z_PK for ZDIVESITE (current Z_MAX + 1)."""
-    row = db.execute(
-        "SELECT Z_MAX FROM Z_PRIMARYKEY WHERE Z_NAME = 'DiveSite'"
-    ).fetchone()
-    return row[0] + 1
+    return row[0], row[1] + 1
 
 
-def apply_gps(db, dive_pk, dive_num, dive_z_opt, dive_notes,
-              entry, exit_, site_ent, geo, dry_run):
-    """Create a dive site and update the dive record."""
+def build_gps_update(dive_pk, dive_num, dive_z_opt, dive_notes,
+                     entry, exit_, site_ent, site_pk, geo):
+    """
+    Build the new dive site row and dive record update for one dive.
+    Returns (gps_text, site_row, dive_row); rows are written in bulk by
+    write_gps_updates().
+    """
     entry_lat, entry_lon = entry
     gps_text = f"Entry: {entry_lat:.5f}, {entry_lon:.5f}"
     if exit_:
@@ -215,45 +516,49 @@ def apply_gps(db, dive_pk, dive_num, dive_z_opt, dive_notes,
     else:
         new_notes = f"[Swift AI GPS] {gps_text}"
 
-    if dry_run:
-        return gps_text
+    # ZUUID is required for Core Data object identity; ZMODIFIED is a
+    # Core Data epoch timestamp
+    site_uuid = str(uuid.uuid4()).upper()
+    now = time.time() - 978307200  # Core Data epoch
+
+    site_row = (site_pk, site_ent, site_uuid, site_name, entry_lat, entry_lon,
+                (geo[0] if geo else None),
+                (geo[1] if geo else None),
+                (geo[2] if geo else None),
+                now)
+    dive_row = (site_pk, new_notes, dive_z_opt + 1, dive_pk)
+    return gps_text, site_row, dive_row
+
 
-    # Create new ZDIVESITE — match MacDive's Core Data defaults:
-    #   ZUUID: required for Core Data object identity
-    #   ZMODIFIED: Core Data epoch timestamp
+def write_gps_updates(cur, site_rows, dive_rows):
+    """Create the dive sites and update the dive records, in batched statements."""
+    if not site_rows:
+        return
+
+    # Create new ZDIVESITE rows — match MacDive's Core Data defaults:
     #   ZALTITUDE: defaults to 0.0
     #   ZWATERTYPE: defaults to 'Salt' (most GPS dives are ocean)
     #   ZDIFFICULTY: defaults to empty string (MacDive uses '' not NULL)
-    site_pk = next_site_pk(db)
-    site_uuid = str(uuid.uuid4()).upper()
-    now = time.time() - 978307200  # Core Data epoch
-
-    db.execute("""
+    cur.executemany("""
         INSERT INTO ZDIVESITE
             (Z_PK, Z_ENT, Z_OPT, ZUUID, ZNAME, ZGPSLAT, ZGPSLON,
              ZCOUNTRY, ZLOCATION, ZBODYOFWATER, ZWATERTYPE,
              ZDIFFICULTY, ZALTITUDE, ZMODIFIED)
         VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, 'Salt', '', 0.0, ?)
-    """, (site_pk, site_ent, site_uuid, site_name, entry_lat, entry_lon,
-          (geo[0] if geo else None),
-          (geo[1] if geo else None),
-          (geo[2] if geo else None),
-          now))
-
-    # Update Z_PRIMARYKEY.Z_MAX for DiveSite
-    db.execute(
+    """, site_rows)
+
+    # Update Z_PRIMARYKEY.Z_MAX for DiveSite to the last PK handed out
+    cur.execute(
         "UPDATE Z_PRIMARYKEY SET Z_MAX = ? WHERE Z_NAME = 'DiveSite'",
-        (site_pk,)
+        (site_rows[-1][0],)
     )
 
-    # Link dive to new site and update notes
-    db.execute("""
+    # Link dives to their new sites and update notes
+    cur.executemany("""
         UPDATE ZDIVE
         SET ZRELATIONSHIPDIVESITE = ?, ZNOTES = ?, Z_OPT = ?
         WHERE Z_PK = ?
-    """, (site_pk, new_notes, dive_z_opt + 1, dive_pk))
-
-    return gps_text
+    """, dive_rows)
 
 
 # --- Main ---------------------------------------------------------------------
@@ -299,7 +604,13 @@ def main():
         print(f"Backup saved to: {backup}\n")
 
     db = sqlite3.connect(db_path)
-    site_ent = get_divesite_ent(db)
+    if not dry_run:
+        # One explicit BEGIN IMMEDIATE for the whole run: it journals once,
+        # and holds the write lock from before Z_MAX is read so no other
+        # writer can hand out the same site PKs.
+        db.isolation_level = None
+        db.execute("BEGIN IMMEDIATE")
+    site_ent, site_pk = get_divesite_keys(db)
     candidates = find_candidates(db)
 
     if not candidates:
@@ -311,38 +622,107 @@ def main():
 
     updated = 0
     skipped = 0
+    corrupt = 0
+
+    # One cursor for the batched writes. This only saves creating a Cursor
+    # object per statement; prepared statements are cached per connection.
+    cur = db.cursor()
+
+    # Site PKs continue from site_pk; rows are written in bulk after the loop,
+    # so per-dive lines say "will update" until the commit is confirmed.
+    site_rows = []
+    dive_rows = []
+
+    # Geocoding runs on one background thread at Nominatim's 1 req/sec while
+    # the main thread keeps decompressing; results are collected in order.
+    # Lookups are cached on disk by rounded coordinates, and repeat visits to
+    # one site within a run share a single request.
+    geocoder = ThreadPoolExecutor(max_workers=1) if do_geocode else None
+    geocode = rate_limited(reverse_geocode, 1.0)
+    cache = open_geocode_cache() if do_geocode else None
+    lookups = {}
+    pending = []
 
-    for dive_pk, dive_num, raw_data, notes, site_fk, z_opt in candidates:
-        label = f"Dive {dive_num}" if dive_num else f"Dive (PK={dive_pk})"
-
-        result = extract_gps(raw_data)
-        if result is None:
-            print(f"  {label}: no Swift AI GPS in raw data — skipped")
-            skipped += 1
-            continue
-
-        entry, exit_ = result
-
-        # Reverse geocode entry coordinates
-        geo = None
-        if do_geocode:
-            if updated > 0:
-                time.sleep(1)  # Nominatim rate limit: 1 req/sec
-            geo = reverse_geocode(entry[0], entry[1])
-
-        gps_text = apply_gps(db, dive_pk, dive_num, z_opt, notes,
-                             entry, exit_, site_ent, geo, dry_run)
-        action = "would update" if dry_run else "updated"
-        print(f"  {label}: {action} — {gps_text}")
-        updated += 1
+    try:
+        # Blobs are read here and all DB access stays in this process;
+        # decompression may run in worker processes (see extract_gps_all).
+        results = extract_gps_all(db, candidates)
+        for (dive_pk, dive_num, notes, site_fk, z_opt), result in zip(
+                candidates, results):
+            key = future = None
+            if geocoder and isinstance(result, tuple):
+                entry = result[0]
+                key = geocode_key(entry[0], entry[1])
+                future = lookups.get(key)
+                if future is None and not (cache and cached_geocode(cache, key)):
+                    future = geocoder.submit(geocode, entry[0], entry[1])
+                    lookups[key] = future
+            pending.append((dive_pk, dive_num, notes, z_opt, result, key, future))
+
+        for dive_pk, dive_num, notes, z_opt, result, key, future in pending:
+            label = f"Dive {dive_num}" if dive_num else f"Dive (PK={dive_pk})"
+
+            if result is None:
+                print(f"  {label}: no Swift AI GPS in raw data — skipped")
+                skipped += 1
+                continue
+            if isinstance(result, ValueError):
+                print(f"  {label}: raw data too large/corrupt ({result}) — skipped")
+                corrupt += 1
+                continue
+
+            entry, exit_ = result
+
+            # Reverse geocode entry coordinates
+            geo = None
+            if cache and key:
+                geo = cached_geocode(cache, key)
+            if geo is None and future:
+                try:
+                    geo = future.result()
+                except Exception as e:
+                    print(f"    geocoding failed: {e}")
+                else:
+                    if cache:
+                        store_geocode(cache, key, geo)
+
+            gps_text, site_row, dive_row = build_gps_update(
+                dive_pk, dive_num, z_opt, notes, entry, exit_,
+                site_ent, site_pk, geo)
+            site_rows.append(site_row)
+            dive_rows.append(dive_row)
+            site_pk += 1
+            action = "would update" if dry_run else "will update"
+            print(f"  {label}: {action} — {gps_text}")
+            updated += 1
+
+        if not dry_run:
+            write_gps_updates(cur, site_rows, dive_rows)
+    except BaseException:
+        for *_, future in pending:
+            if future:
+                future.cancel()
+        if not dry_run:
+            db.execute("ROLLBACK")
+            print("\nERROR: run aborted — rolled back, no changes were written.")
+        db.close()
+        raise
+    finally:
+        if geocoder:
+            geocoder.shutdown()
+            close_nominatim()
+        if cache:
+            cache.close()
 
     if not dry_run:
-        db.commit()
+        db.execute("COMMIT")
+        print(f"\nCommitted {updated} dive update(s) to {db_path}.")
 
     db.close()
 
     print(f"\nDone. {updated} dive(s) {'would be ' if dry_run else ''}updated, "
-          f"{skipped} skipped (no GPS).")
+          f"{skipped} skipped (no GPS)"
+          + (f", {corrupt} skipped (corrupt raw data)" if corrupt else "") + ".")
 
     if dry_run and updated > 0:
         print("\nRe-run with --apply to write changes.")